@@ -1,6 +1,8 @@
 import os
+import sys
 import logging
-from collections import defaultdict
+from collections import deque, OrderedDict
+from dataclasses import dataclass
 import google.generativeai as genai
 from telegram import Update, Bot
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
@@ -9,13 +11,22 @@ from dotenv import load_dotenv
 import time
 import json
 import re
+import heapq
+import sqlite3
+import threading
 import gspread
 import psutil
-from datetime import datetime
+from datetime import datetime, timezone
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from gspread.exceptions import APIError, WorksheetNotFound
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from telegram.error import RetryAfter
+from telegram.request import HTTPXRequest
 import uuid
 import pytz
+from aiolimiter import AsyncLimiter
+from io import BytesIO
 
 # Load environment variables from .env file
 load_dotenv()
@@ -39,9 +50,61 @@ except (ValueError, TypeError):
     logging.error("BROADCAST_ADMIN_ID is missing or not a valid number. Broadcast functionality will be disabled.")
 
 # --- Global Stats Variables ---
-start_time = datetime.now()
+# Monotonic start mark: uptime stays correct across wall-clock (NTP) jumps.
+start_time = time.monotonic()
+
+def format_uptime():
+    elapsed = int(time.monotonic() - start_time)
+    days, remainder = divmod(elapsed, 86400)
+    hours, remainder = divmod(remainder, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{days}d {hours}h {minutes}m {seconds}s"
+
 total_messages_processed = 0
 known_users = set()
+# Chat type ('private'/'group'/'supergroup'/'channel') keyed by chat_id.
+# Known at save time from the update itself, so broadcasts don't need a
+# get_chat round-trip per recipient.
+chat_types = {}
+
+# --- System metrics sampling ---
+# Prime cpu_percent so later interval=None calls return the usage since the
+# previous call instead of a meaningless 0.0, and cache the slow-moving
+# RAM/disk numbers so /stats never blocks the event loop.
+psutil.cpu_percent(interval=None)
+_SYS_SAMPLE_INTERVAL = 2.0
+
+@dataclass(slots=True)
+class SystemStats:
+    ram: float = 0.0
+    cpu: float = 0.0
+    disk: float = 0.0
+
+system_stats = SystemStats(ram=psutil.virtual_memory().percent, disk=psutil.disk_usage('/').percent)
+
+async def system_sampler_loop():
+    """One bundled /proc pass on a fixed cadence; /stats just reads fields.
+
+    cpu_percent(interval=None) measures usage since its previous call, so a
+    steady sampling rhythm gives stable readings regardless of how often
+    (or rarely) the stats commands run.
+    """
+    def _snapshot():
+        return (
+            psutil.cpu_percent(interval=None),
+            psutil.virtual_memory().percent,
+            psutil.disk_usage('/').percent,
+        )
+
+    while True:
+        await asyncio.sleep(_SYS_SAMPLE_INTERVAL)
+        # The /proc and statvfs reads are syscalls; one bundled to_thread hop
+        # keeps even those micro-stalls off the event loop.
+        system_stats.cpu, system_stats.ram, system_stats.disk = await asyncio.to_thread(_snapshot)
+
+def get_system_usage():
+    """Returns (ram%, cpu%, disk%) from the latest background sample."""
+    return system_stats.ram, system_stats.cpu, system_stats.disk
 
 # --- Logging Basic Configuration ---
 logging.basicConfig(
@@ -69,29 +132,174 @@ Personality & Rules:
 Important: Your goal is to be a fun, smart, and loyal friend to the users, representing your creator's vision.
 """
 
+# --- Bot identity (filled in once at startup by post_init) ---
+BOT_USERNAME = ""
+BOT_USERNAME_LOWER = ""
+BOT_MENTION = ""
+BOT_MENTION_LEN = 0
+BOT_ID = 0
+
+async def post_init(application: Application) -> None:
+    """Caches the bot's immutable identity so handlers never call get_me()."""
+    global BOT_USERNAME, BOT_USERNAME_LOWER, BOT_MENTION, BOT_MENTION_LEN, BOT_ID
+    me = await application.bot.get_me()
+    BOT_ID = me.id
+    BOT_USERNAME = me.username
+    BOT_USERNAME_LOWER = me.username.lower()
+    BOT_MENTION = f"@{BOT_USERNAME_LOWER}"
+    BOT_MENTION_LEN = len(BOT_MENTION)
+    global _laila_trigger_re
+    _laila_trigger_re = re.compile(
+        _ADDRESSED_RE.pattern + r"|@?" + re.escape(BOT_USERNAME_LOWER) + r"\b",
+        re.IGNORECASE
+    )
+    logger.info(f"Cached bot identity: @{BOT_USERNAME}")
+    application.create_task(qa_flush_loop())
+    application.create_task(system_sampler_loop())
+    application.create_task(run_sheets(warm_sheet_caches))
+    application.create_task(sheet_cache_refresh_loop())
+
+async def post_shutdown(application: Application) -> None:
+    # Push any still-queued rows out before the process exits.
+    flush_qa_rows()
+    flush_chat_rows()
+
 # --- Chat History Management (in-memory) ---
-chat_histories = defaultdict(list)
+# deque(maxlen=...) evicts the oldest turn in O(1); list.pop(0) shifted the
+# whole history on every message once a chat hit the cap.
 MAX_HISTORY_LENGTH = 20
+# The outer map is also bounded: beyond _MAX_TRACKED_CHATS the least
+# recently active chat's history is dropped, so a long-running process
+# can't leak memory one dormant group at a time.
+_MAX_TRACKED_CHATS = 5000
+chat_histories = OrderedDict()
+
+def _history_for(chat_id):
+    history = chat_histories.get(chat_id)
+    if history is None:
+        history = deque(maxlen=MAX_HISTORY_LENGTH)
+        chat_histories[chat_id] = history
+        if len(chat_histories) > _MAX_TRACKED_CHATS:
+            chat_histories.popitem(last=False)
+    else:
+        chat_histories.move_to_end(chat_id)
+    return history
 
+# Turns are stored as (role, text) tuples — two pointers each, with the role
+# strings interned — instead of a dict-and-list wrapper per turn. They are
+# expanded to the SDK's {'role': ..., 'parts': [...]} shape only at call time.
 def add_to_history(chat_id, role, text):
-    chat_histories[chat_id].append({'role': role, 'parts': [text]})
-    if len(chat_histories[chat_id]) > MAX_HISTORY_LENGTH:
-        chat_histories[chat_id].pop(0)
+    _history_for(chat_id).append((sys.intern(role), text))
+
+def history_for_gemini(chat_id):
+    return [{'role': role, 'parts': [text]} for role, text in chat_histories.get(chat_id, ())]
+
+# Only the last few exchanges go to Gemini verbatim; older turns collapse
+# into one stub line. The stable prefix keeps prompts small (and cacheable)
+# instead of shipping all 20 stored turns on every message.
+_VERBATIM_TURNS = 10  # entries, i.e. ~5 user/model exchanges
+
+def build_prompt_history(chat_id):
+    turns = chat_histories.get(chat_id, ())
+    if len(turns) <= _VERBATIM_TURNS:
+        return history_for_gemini(chat_id)
+    turns = list(turns)
+    recent = turns[-_VERBATIM_TURNS:]
+    # Gemini histories must open with a user turn, so drop a leading model turn.
+    while recent and recent[0][0] != 'user':
+        recent.pop(0)
+    older_topics = " | ".join(
+        text[:60] for role, text in turns[:-_VERBATIM_TURNS] if role == 'user'
+    )
+    trimmed = [
+        {'role': 'user', 'parts': [f"[Earlier conversation summarized. Topics: {older_topics}]"]},
+        {'role': 'model', 'parts': ["Theek hai, sab yaad hai!"]},
+    ]
+    trimmed.extend({'role': role, 'parts': [text]} for role, text in recent)
+    return trimmed
 
 # --- Bot Enable/Disable State (for admin control) ---
-bot_status = defaultdict(lambda: True)
+# Plain dicts with .get defaults: defaultdict inserted an entry on every
+# read, so mere lookups grew these maps without bound.
+bot_status = {}
 global_bot_status = True
-awaiting_name = defaultdict(lambda: False)
+awaiting_name = {}
 
 # --- API Key Management for Quota and Cooldown ---
-current_api_key_index = 0
-active_api_key = GEMINI_API_KEYS[current_api_key_index]
-key_cooldown_until = defaultdict(lambda: 0)
+# Keys sit in a min-heap ordered by when they next become available, so the
+# request path picks the best key in O(log n) instead of rotating an index
+# and testing each key's cooldown in turn. Heap slots are refreshed lazily
+# from key_cooldown_until when they surface at the top.
+# Unset GEMINI_API_KEY_* slots come through as None; drop them so the heap
+# never compares None against a key string (and never hands None out).
+_available_keys = [key for key in GEMINI_API_KEYS if key]
+active_api_key = _available_keys[0] if _available_keys else None
+key_cooldown_until = {}
+_key_heap = [(0.0, 0, key) for key in _available_keys]
+heapq.heapify(_key_heap)
+_key_heap_lock = asyncio.Lock()
+
+async def pick_best_key():
+    """Returns (key, available_at) for the least-loaded key that frees up soonest."""
+    async with _key_heap_lock:
+        while True:
+            available_at, usage, key = _key_heap[0]
+            recorded = key_cooldown_until.get(key, 0.0)
+            if recorded > available_at:
+                heapq.heapreplace(_key_heap, (recorded, usage, key))
+                continue
+            # Record the pick so keys tied on availability rotate by usage
+            # instead of hammering whichever happens to sort first.
+            heapq.heapreplace(_key_heap, (available_at, usage + 1, key))
+            return key, available_at
 
 genai.configure(api_key=active_api_key)
 model_name = 'gemini-2.5-flash-lite'
 model = genai.GenerativeModel(model_name, system_instruction=LAILA_SYSTEM_PROMPT)
 
+# genai.configure sets a process-global key, so switching keys needs a
+# reconfigure — but only when the key actually changes. Model objects are
+# cached per key rather than rebuilt on every attempt of the retry loop.
+_configured_key = active_api_key
+_model_cache = {active_api_key: model}
+
+def _ensure_configured(api_key):
+    global _configured_key
+    if api_key != _configured_key:
+        genai.configure(api_key=api_key)
+        _configured_key = api_key
+
+def get_chat_model(api_key):
+    global model
+    _ensure_configured(api_key)
+    cached = _model_cache.get(api_key)
+    if cached is None:
+        cached = _model_cache[api_key] = genai.GenerativeModel(model_name, system_instruction=LAILA_SYSTEM_PROMPT)
+    model = cached
+    return cached
+
+# Generation configs are constant per call site; build them once instead of
+# allocating a fresh object on every request.
+_NAME_EXTRACT_CONFIG = genai.types.GenerationConfig(temperature=0.1, max_output_tokens=15)
+_SHORT_REPLY_CONFIG = genai.types.GenerationConfig(max_output_tokens=100, temperature=0.9)
+_DETAILED_REPLY_CONFIG = genai.types.GenerationConfig(max_output_tokens=350, temperature=0.9)
+
+# LLM calls use the SDK's native async API so they await on the event loop
+# directly instead of parking a worker thread per in-flight request; the
+# semaphore still bounds concurrency against the API.
+_gemini_semaphore = asyncio.Semaphore(8)
+
+async def run_gemini(func, *args, **kwargs):
+    async with _gemini_semaphore:
+        return await func(*args, **kwargs)
+
+# Sheets calls get their own small thread pool so slow spreadsheet I/O never
+# starves asyncio's default executor (which the Gemini calls also share).
+_sheets_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sheets")
+
+async def run_sheets(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_sheets_executor, func, *args)
+
 # --- Fallback Responses (Static Memory) ---
 fallback_responses = {
     "hello": "Hello! Laila is here. How are you?",
@@ -100,8 +308,155 @@ fallback_responses = {
     "who are you": "I am Laila, your friendly AI assistant! You can ask me anything you want.",
 }
 
-# --- Google Sheets Global Connection Variable ---
+# --- Local chat store (SQLite mirror of the chats worksheet) ---
+# Keeps chat metadata warm across restarts and gives O(1) local inserts;
+# Google Sheets remains the cloud copy.
+CHATS_DB_PATH = os.getenv("CHATS_DB_PATH", "chats.db")
+_chats_db = None
+_chats_db_lock = threading.Lock()
+
+def get_chats_db():
+    global _chats_db
+    if _chats_db is None:
+        _chats_db = sqlite3.connect(CHATS_DB_PATH, isolation_level=None, check_same_thread=False)
+        _chats_db.execute("PRAGMA journal_mode=WAL")
+        _chats_db.execute("PRAGMA synchronous=NORMAL")
+        _chats_db.execute(
+            "CREATE TABLE IF NOT EXISTS chats(id INTEGER PRIMARY KEY, type TEXT, size INTEGER, last_seen INTEGER)"
+        )
+        _chats_db.execute(
+            "CREATE TABLE IF NOT EXISTS settings(key TEXT PRIMARY KEY, value TEXT)"
+        )
+    return _chats_db
+
+def db_set_setting(key, value):
+    try:
+        with _chats_db_lock:
+            get_chats_db().execute(
+                "INSERT INTO settings(key, value) VALUES(?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                (key, str(value))
+            )
+    except Exception as e:
+        logger.error(f"Error writing setting {key} to local store: {e}")
+
+def db_get_setting(key, default=None):
+    try:
+        with _chats_db_lock:
+            row = get_chats_db().execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()
+        return row[0] if row else default
+    except Exception as e:
+        logger.error(f"Error reading setting {key} from local store: {e}")
+        return default
+
+def db_record_chat(chat_id, chat_type=""):
+    try:
+        with _chats_db_lock:
+            get_chats_db().execute(
+                "INSERT INTO chats(id, type, last_seen) VALUES(?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET type=excluded.type, last_seen=excluded.last_seen",
+                (chat_id, chat_type, int(time.time()))
+            )
+    except Exception as e:
+        logger.error(f"Error writing chat {chat_id} to local store: {e}")
+
+def db_record_member_count(chat_id, count):
+    try:
+        with _chats_db_lock:
+            get_chats_db().execute("UPDATE chats SET size=? WHERE id=?", (count, chat_id))
+    except Exception as e:
+        logger.error(f"Error writing member count for chat {chat_id} to local store: {e}")
+
+def db_load_chats():
+    """Warms known_users, chat_types and member counts from the local mirror."""
+    try:
+        with _chats_db_lock:
+            rows = get_chats_db().execute("SELECT id, type, size FROM chats").fetchall()
+        now = time.monotonic()
+        for cid, ctype, size in rows:
+            known_users.add(cid)
+            if ctype:
+                chat_types[cid] = ctype
+            if size:
+                _member_count_cache[cid] = (size, now)
+        logger.info(f"Loaded {len(rows)} chats from the local store.")
+    except Exception as e:
+        logger.error(f"Error loading chats from local store: {e}")
+    # The power switch survives restarts: a /poweroff'd bot stays off until
+    # the owner turns it back on, not until the next redeploy.
+    global global_bot_status
+    global_bot_status = db_get_setting('global_bot_status', '1') == '1'
+
+# --- Google Sheets Global Connection Variables (cached for the process lifetime) ---
+SHEET_URL = "https://docs.google.com/spreadsheets/d/1s8rXXPKePuTQ3E2R0O-bZl3NJb1N7akdkE52WVpoOGg/edit"
 google_sheet = None
+_gs_client = None
+_gs_spreadsheet = None
+_chats_worksheet = None
+_names_worksheet = None
+
+# The service-account JSON never changes at runtime; parse it once and hand
+# the same dict to every client rebuild after a session reset.
+_creds_dict = None
+
+# Handle initialization can race: the Sheets executor runs 4 worker threads,
+# any of which may find the caches empty after a reset. One lock serializes
+# the (rare) rebuilds; steady-state calls just read the populated globals.
+_gs_init_lock = threading.Lock()
+
+def _get_creds_dict():
+    global _creds_dict
+    if _creds_dict is None:
+        creds_json = os.getenv("GOOGLE_SHEETS_CREDENTIALS")
+        if not creds_json:
+            raise RuntimeError("GOOGLE_SHEETS_CREDENTIALS not found in environment variables.")
+        _creds_dict = json.loads(creds_json)
+    return _creds_dict
+
+def get_gspread_client():
+    """Builds the gspread client once and reuses it; every fresh build is an OAuth round-trip."""
+    global _gs_client
+    if _gs_client:
+        return _gs_client
+    with _gs_init_lock:
+        if _gs_client is None:
+            # The client's requests session keeps connections alive by
+            # default, so repeat operations reuse the TCP/TLS connection.
+            _gs_client = gspread.service_account_from_dict(_get_creds_dict())
+    return _gs_client
+
+def reset_gspread_client():
+    """Drops all cached Sheets handles so the next call re-authenticates.
+
+    gspread sessions silently go stale after minutes of inactivity; callers
+    use run_sheet_op below to recover transparently.
+    """
+    global _gs_client, _gs_spreadsheet, _chats_worksheet, _names_worksheet, google_sheet
+    _gs_client = None
+    _gs_spreadsheet = None
+    _chats_worksheet = None
+    _names_worksheet = None
+    google_sheet = None
+
+def run_sheet_op(operation):
+    """Runs a gspread operation, re-authenticating and retrying once on failure."""
+    try:
+        return operation()
+    # requests' ConnectionError subclasses IOError, not the builtin
+    # ConnectionError, so stale keep-alive drops need their own entry here.
+    except (APIError, RequestsConnectionError, ConnectionError) as e:
+        logger.warning(f"Google Sheets call failed ({e}); re-authenticating and retrying once.")
+        reset_gspread_client()
+        return operation()
+
+def get_spreadsheet():
+    global _gs_spreadsheet
+    if _gs_spreadsheet is None:
+        client = get_gspread_client()
+        with _gs_init_lock:
+            if _gs_spreadsheet is None:
+                _gs_spreadsheet = client.open_by_url(SHEET_URL)
+    return _gs_spreadsheet
 
 # --- Connect to Google Sheets ---
 def get_google_sheet_connection():
@@ -109,23 +464,25 @@ def get_google_sheet_connection():
     if google_sheet:
         return google_sheet, None
     try:
-        creds_json = os.getenv("GOOGLE_SHEETS_CREDENTIALS")
-        if not creds_json:
-            return None, "GOOGLE_SHEETS_CREDENTIALS not found in environment variables."
-        
-        creds_dict = json.loads(creds_json)
-        
-        client = gspread.service_account_from_dict(creds_dict)
-        
-        sheet_url = "https://docs.google.com/spreadsheets/d/1s8rXXPKePuTQ3E2R0O-bZl3NJb1N7akdkE52WVpoOGg/edit"
-        google_sheet = client.open_by_url(sheet_url).sheet1
-        
+        google_sheet = get_spreadsheet().sheet1
         logger.info("Successfully connected to Google Sheets.")
         return google_sheet, None
     except Exception as e:
         logger.error(f"Error connecting to Google Sheets: {e}")
         return None, f"Error connecting to Google Sheets: {e}"
 
+def _qa_worksheet():
+    """Q&A worksheet accessor for use inside run_sheet_op operations.
+
+    Handles must be looked up inside the retried operation — a handle bound
+    before run_sheet_op would survive reset_gspread_client() and make the
+    retry re-run against the same stale client.
+    """
+    sheet, error = get_google_sheet_connection()
+    if error:
+        raise ConnectionError(error)
+    return sheet
+
 # --- Check for sensitive keywords ---
 SENSITIVE_KEYWORDS = [
     "phone", "number", "address", "password", "pancard", "aadhar", "account",
@@ -133,127 +490,230 @@ SENSITIVE_KEYWORDS = [
     "जन्मतिथि", "पैन कार्ड", "आधार", "खाता", "पासवर्ड", "ओटीपी", "पिन"
 ]
 
-def contains_sensitive_data(text: str) -> bool:
-    text_lower = text.lower()
-    for keyword in SENSITIVE_KEYWORDS:
-        if keyword in text_lower:
-            return True
-    return False
+# One compiled alternation gives a single linear scan over the message
+# instead of one substring search per keyword. Longer keywords are listed
+# first so overlapping alternatives ("pin" vs "pincode"-style) match eagerly.
+_SENSITIVE_RE = re.compile(
+    "|".join(re.escape(k) for k in sorted(SENSITIVE_KEYWORDS, key=len, reverse=True))
+)
+# Most traffic is pure ASCII, which can never match the Devanagari keywords;
+# a Latin-only alternation keeps those scans over the smaller automaton.
+_SENSITIVE_LATIN_RE = re.compile(
+    "|".join(
+        re.escape(k)
+        for k in sorted(SENSITIVE_KEYWORDS, key=len, reverse=True)
+        if k.isascii()
+    )
+)
+_SENSITIVE_MIN_LEN = min(len(k) for k in SENSITIVE_KEYWORDS)
+
+def contains_sensitive_data(text_lower: str) -> bool:
+    # Expects already-lowercased text; callers work on the lowered message
+    # anyway, so re-lowering here copied every scanned string once more.
+    if len(text_lower) < _SENSITIVE_MIN_LEN:
+        return False
+    pattern = _SENSITIVE_LATIN_RE if text_lower.isascii() else _SENSITIVE_RE
+    return pattern.search(text_lower) is not None
 
 # --- Store Q&A in Google Sheet (with a check for sensitive data) ---
+# Rows are queued in memory and flushed as one append_rows call every few
+# seconds, so the message path never pays for a Sheets HTTP request and the
+# write quota is amortized across the batch.
+_QA_FLUSH_INTERVAL = 5.0
+_QA_FLUSH_MAX = 50
+_pending_qa_rows = []
+_pending_qa_lock = threading.Lock()
+
 def save_qa_to_sheet(question, answer):
     if contains_sensitive_data(question):
         logger.info(f"Skipping save to sheet due to sensitive content in question: '{question}'")
         return
-        
-    sheet, error = get_google_sheet_connection()
-    if error:
-        logger.error(f"Could not save Q&A: {error}")
+    # Keep the read cache warm immediately; the sheet write follows in batch.
+    _qa_cache[question] = answer
+    with _pending_qa_lock:
+        _pending_qa_rows.append([question, answer])
+        backlog = len(_pending_qa_rows)
+    if backlog >= _QA_FLUSH_MAX:
+        # A traffic burst shouldn't sit in memory until the next tick; kick
+        # off an early flush when the buffer passes the size threshold.
+        try:
+            asyncio.get_running_loop().create_task(run_sheets(flush_qa_rows))
+        except RuntimeError:
+            pass
+
+def flush_qa_rows():
+    with _pending_qa_lock:
+        rows = _pending_qa_rows[:]
+        _pending_qa_rows.clear()
+    if not rows:
+        return
+    try:
+        run_sheet_op(lambda: _qa_worksheet().append_rows(rows, value_input_option='RAW'))
+        logger.info(f"Flushed {len(rows)} Q&A rows to sheet.")
+    except Exception as e:
+        # Put the rows back so the next flush retries them.
+        with _pending_qa_lock:
+            _pending_qa_rows[:0] = rows
+        logger.error(f"Could not save Q&A batch: {e}")
+
+# New chat IDs ride the same batching scheme as Q&A rows.
+_pending_chat_rows = []
+_pending_chat_lock = threading.Lock()
+
+def flush_chat_rows():
+    with _pending_chat_lock:
+        rows = _pending_chat_rows[:]
+        _pending_chat_rows.clear()
+    if not rows:
         return
     try:
-        sheet.append_row([question, answer])
-        logger.info(f"Saved Q&A to sheet: '{question}' -> '{answer}'")
+        run_sheet_op(lambda: get_chats_worksheet().append_rows(rows, value_input_option='RAW'))
+        logger.info(f"Flushed {len(rows)} chat rows to sheet.")
     except Exception as e:
-        logger.error(f"Error saving data to Google Sheet: {e}")
+        with _pending_chat_lock:
+            _pending_chat_rows[:0] = rows
+        logger.error(f"Error saving chat IDs to Google Sheet: {e}")
+
+async def qa_flush_loop():
+    while True:
+        await asyncio.sleep(_QA_FLUSH_INTERVAL)
+        await run_sheets(flush_qa_rows)
+        await run_sheets(flush_chat_rows)
+
+# --- Find answer in Google Sheet (served from an in-process TTL cache) ---
+# The whole Q&A map is fetched at most once per TTL window; lookups between
+# refreshes are plain dict hits instead of a Sheets round-trip per message.
+_SHEET_CACHE_TTL = 300.0
+_qa_cache = {}
+_qa_cache_expiry = 0.0
 
-# --- Find answer in Google Sheet ---
 def find_answer_in_sheet(question):
+    global _qa_cache, _qa_cache_expiry
     if contains_sensitive_data(question):
         logger.info(f"Skipping sheet search due to sensitive content in question: '{question}'")
         return None
-    sheet, error = get_google_sheet_connection()
-    if error:
-        return None
+    if time.monotonic() < _qa_cache_expiry:
+        return _qa_cache.get(question)
     try:
-        all_records = sheet.get_all_records()
-        for record in all_records:
-            if 'Question' in record and record['Question'].lower() == question.lower():
-                return record['Answer']
-        return None
+        # Fetch only the Question/Answer columns instead of get_all_records(),
+        # which downloads every column and builds a dict per row.
+        rows = run_sheet_op(lambda: _qa_worksheet().get('A2:B'))
+        _qa_cache = {row[0].lower(): row[1] for row in rows if len(row) >= 2}
+        _qa_cache_expiry = time.monotonic() + _SHEET_CACHE_TTL
+        return _qa_cache.get(question)
     except Exception as e:
         logger.error(f"Error searching for answer in Google Sheet: {e}")
         return None
         
 # --- Function to clean message before logging ---
-def clean_message_for_logging(message: str, bot_username: str) -> str:
-    cleaned_message = message.lower()
-    cleaned_message = cleaned_message.replace(f"@{bot_username.lower()}", "")
-    cleaned_message = re.sub(r'laila\s*(ko|ka|se|ne|)\s*', '', cleaned_message, flags=re.IGNORECASE)
-    cleaned_message = re.sub(r'\s+', ' ', cleaned_message).strip()
+_LAILA_RE = re.compile(r'laila\s*(ko|ka|se|ne|)\s*')
+_WS_RE = re.compile(r'\s+')
+
+def clean_message_for_logging(message_lower: str) -> str:
+    # Expects an already-lowercased message so callers don't pay for a second copy.
+    # Mentions nearly always lead the message: a length slice drops the prefix
+    # in one copy, and replace() only runs for mid-string mentions.
+    if BOT_MENTION and message_lower.startswith(BOT_MENTION):
+        cleaned_message = message_lower[BOT_MENTION_LEN:].lstrip()
+    elif BOT_MENTION and BOT_MENTION in message_lower:
+        cleaned_message = message_lower.replace(BOT_MENTION, "")
+    else:
+        cleaned_message = message_lower
+    cleaned_message = _LAILA_RE.sub('', cleaned_message)
+    cleaned_message = _WS_RE.sub(' ', cleaned_message).strip()
     return cleaned_message
 
-# --- NEW: Function to get/create the 'chats' worksheet ---
-def get_chats_worksheet(client):
+# --- NEW: Function to get/create the 'chats' worksheet (handle cached) ---
+def get_chats_worksheet():
+    global _chats_worksheet
+    if _chats_worksheet is not None:
+        return _chats_worksheet
+    spreadsheet = get_spreadsheet()
     try:
-        return client.open_by_url("https://docs.google.com/spreadsheets/d/1s8rXXPKePuTQ3E2R0O-bZl3NJb1N7akdkE52WVpoOGg/edit").worksheet("chats")
+        _chats_worksheet = spreadsheet.worksheet("chats")
     except WorksheetNotFound:
-        spreadsheet = client.open_by_url("https://docs.google.com/spreadsheets/d/1s8rXXPKePuTQ3E2R0O-bZl3NJb1N7akdkE52WVpoOGg/edit")
-        return spreadsheet.add_worksheet("chats", rows="1000", cols="2")
+        # Three columns: chat id, first-seen timestamp, chat type. A narrower
+        # grid makes values.append reject the queued rows outright.
+        _chats_worksheet = spreadsheet.add_worksheet("chats", rows="1000", cols="3")
+    return _chats_worksheet
 
 # --- NEW: Function to save a chat ID to Google Sheets ---
-def save_chat_id(chat_id):
-    try:
-        creds_json = os.getenv("GOOGLE_SHEETS_CREDENTIALS")
-        if not creds_json:
-            logger.error("GOOGLE_SHEETS_CREDENTIALS not found.")
-            return
-        creds_dict = json.loads(creds_json)
-        client = gspread.service_account_from_dict(creds_dict)
-        chat_sheet = get_chats_worksheet(client)
-        existing_ids = chat_sheet.col_values(1)
-        if str(chat_id) in existing_ids:
-            return
-        chat_sheet.append_row([str(chat_id), datetime.now().isoformat()])
-        logger.info(f"Saved new chat ID: {chat_id}")
-    except Exception as e:
-        logger.error(f"Error saving chat ID to Google Sheet: {e}")
+def save_chat_id(chat_id, chat_type=""):
+    # Callers only reach this for IDs absent from known_users, and the SQLite
+    # mirror upserts, so no need to re-download column A for deduplication.
+    db_record_chat(chat_id, chat_type)
+    with _pending_chat_lock:
+        _pending_chat_rows.append([str(chat_id), datetime.now().isoformat(), chat_type])
+    logger.info(f"Queued new chat ID: {chat_id} ({chat_type or 'unknown type'})")
 
 # --- NEW: Function to load all known users/chats from Google Sheets ---
 def load_known_users():
     global known_users
     try:
-        creds_json = os.getenv("GOOGLE_SHEETS_CREDENTIALS")
-        if not creds_json:
-            logger.error("GOOGLE_SHEETS_CREDENTIALS not found.")
-            return
-        creds_dict = json.loads(creds_json)
-        client = gspread.service_account_from_dict(creds_dict)
-        chat_sheet = get_chats_worksheet(client)
-        chat_ids = chat_sheet.col_values(1)
-        known_users = set(chat_ids)
+        rows = run_sheet_op(lambda: get_chats_worksheet().get('A:C'))
+        # Store chat IDs as ints everywhere; mixed str/int membership checks
+        # silently miss and double the set's footprint.
+        known_users |= {int(row[0]) for row in rows if row and row[0].lstrip('-').isdigit()}
+        for row in rows:
+            if row and row[0].lstrip('-').isdigit() and len(row) >= 3 and row[2]:
+                chat_types[int(row[0])] = row[2]
         logger.info(f"Loaded {len(known_users)} chats from Google Sheets.")
     except Exception as e:
         logger.error(f"Error loading known users from Google Sheet: {e}")
 
-# --- NEW: Function to get/create the 'names' worksheet ---
-def get_names_worksheet(client):
+# --- NEW: Function to get/create the 'names' worksheet (handle cached) ---
+def get_names_worksheet():
+    global _names_worksheet
+    if _names_worksheet is not None:
+        return _names_worksheet
+    spreadsheet = get_spreadsheet()
     try:
-        return client.open_by_url("https://docs.google.com/spreadsheets/d/1s8rXXPKePuTQ3E2R0O-bZl3NJb1N7akdkE52WVpoOGg/edit").worksheet("names")
+        _names_worksheet = spreadsheet.worksheet("names")
     except WorksheetNotFound:
-        spreadsheet = client.open_by_url("https://docs.google.com/spreadsheets/d/1s8rXXPKePuTQ3E2R0O-bZl3NJb1N7akdkE52WVpoOGg/edit")
-        return spreadsheet.add_worksheet("names", rows="1000", cols="2")
+        _names_worksheet = spreadsheet.add_worksheet("names", rows="1000", cols="2")
+    return _names_worksheet
+
+# Same TTL cache as the Q&A sheet: one fetch per window, dict hits between.
+_names_cache = {}
+_names_cache_expiry = 0.0
+# Row positions in the names sheet, rebuilt with the cache, so updates go
+# straight to a known range instead of re-downloading the sheet to scan it.
+_names_row_index = {}
+
+def _index_names_rows(rows):
+    global _names_cache, _names_cache_expiry, _names_row_index
+    _names_cache = {row[0]: row[1] for row in rows if len(row) >= 2}
+    _names_row_index = {row[0]: i + 2 for i, row in enumerate(rows) if row}
+    _names_cache_expiry = time.monotonic() + _SHEET_CACHE_TTL
 
 # --- NEW: Function to save a user's name ---
 def save_user_name(user_id, user_name):
+    user_id_str = str(user_id)
+    # The caller sees their new name right away even before the sheet write lands.
+    _names_cache[user_id_str] = user_name
     try:
-        creds_json = os.getenv("GOOGLE_SHEETS_CREDENTIALS")
-        if not creds_json:
-            logger.error("GOOGLE_SHEETS_CREDENTIALS not found.")
+        row = _names_row_index.get(user_id_str)
+        if row is None:
+            # Saved since the last full fetch: a find() on the ID column is a
+            # point lookup instead of re-downloading every record.
+            cell = run_sheet_op(lambda: get_names_worksheet().find(user_id_str, in_column=1))
+            if cell:
+                row = _names_row_index[user_id_str] = cell.row
+        if row is not None:
+            run_sheet_op(lambda: get_names_worksheet().batch_update(
+                [{'range': f'A{row}:B{row}', 'values': [[user_id_str, user_name]]}]))
+            logger.info(f"Updated name for user {user_id} to '{user_name}'.")
             return
-        creds_dict = json.loads(creds_json)
-        client = gspread.service_account_from_dict(creds_dict)
-        name_sheet = get_names_worksheet(client)
-        
-        # Check if the user already exists
-        all_records = name_sheet.get_all_records()
-        for i, record in enumerate(all_records):
-            if str(record.get('UserID')) == str(user_id):
-                name_sheet.update_cell(i + 2, 2, user_name)
-                logger.info(f"Updated name for user {user_id} to '{user_name}'.")
-                return
-
-        # If user does not exist, add a new row
-        name_sheet.append_row([str(user_id), user_name])
+
+        # If user does not exist, add a new row. The row position comes from
+        # the API response, never from a local count that could be stale or
+        # racing — a wrong index would batch_update someone else's row.
+        result = run_sheet_op(lambda: get_names_worksheet().append_row([user_id_str, user_name]))
+        updated_range = result.get('updates', {}).get('updatedRange', '') if isinstance(result, dict) else ''
+        range_match = re.search(r'!A(\d+)', updated_range)
+        if range_match:
+            _names_row_index[user_id_str] = int(range_match.group(1))
+        # Otherwise leave the index unset; the next rename falls back to find().
         logger.info(f"Saved new name for user {user_id}: '{user_name}'.")
 
     except Exception as e:
@@ -261,34 +721,72 @@ def save_user_name(user_id, user_name):
 
 # --- NEW: Function to find a user's name ---
 def find_user_name(user_id):
-    try:
-        creds_json = os.getenv("GOOGLE_SHEETS_CREDENTIALS")
-        if not creds_json:
-            logger.error("GOOGLE_SHEETS_CREDENTIALS not found.")
+    user_id_str = str(user_id)
+    if time.monotonic() < _names_cache_expiry:
+        if user_id_str in _names_cache:
+            return _names_cache[user_id_str]
+        # Name saved since the last full fetch: a find() on the ID column is a
+        # point lookup instead of re-downloading every record. Misses are
+        # cached as None so unknown users don't trigger a find per message.
+        try:
+            cell = run_sheet_op(lambda: get_names_worksheet().find(user_id_str, in_column=1))
+            name = run_sheet_op(lambda: get_names_worksheet().cell(cell.row, 2).value) if cell else None
+            if cell:
+                _names_row_index[user_id_str] = cell.row
+            _names_cache[user_id_str] = name
+            return name
+        except Exception as e:
+            logger.error(f"Error finding user name in Google Sheet: {e}")
             return None
-        creds_dict = json.loads(creds_json)
-        client = gspread.service_account_from_dict(creds_dict)
-        name_sheet = get_names_worksheet(client)
-        all_records = name_sheet.get_all_records()
-        for record in all_records:
-            if str(record.get('UserID')) == str(user_id):
-                return record.get('Name')
-        return None
+    try:
+        rows = run_sheet_op(lambda: get_names_worksheet().get_values('A2:B'))
+        _index_names_rows(rows)
+        return _names_cache.get(user_id_str)
     except Exception as e:
         logger.error(f"Error finding user name in Google Sheet: {e}")
         return None
 
+# Warm both read caches up front and re-fetch on the TTL cadence from the
+# background, so the first message after an expiry window doesn't pay the
+# full-sheet download inline.
+def warm_sheet_caches():
+    global _qa_cache, _qa_cache_expiry
+    try:
+        rows = run_sheet_op(lambda: _qa_worksheet().get('A2:B'))
+        _qa_cache = {row[0].lower(): row[1] for row in rows if len(row) >= 2}
+        _qa_cache_expiry = time.monotonic() + _SHEET_CACHE_TTL
+    except Exception as e:
+        logger.error(f"Error warming Q&A cache: {e}")
+    try:
+        name_rows = run_sheet_op(lambda: get_names_worksheet().get_values('A2:B'))
+        _index_names_rows(name_rows)
+        logger.info(f"Warmed sheet caches: {len(_qa_cache)} Q&A rows, {len(_names_cache)} names.")
+    except Exception as e:
+        logger.error(f"Error warming names cache: {e}")
+
+async def sheet_cache_refresh_loop():
+    while True:
+        await asyncio.sleep(_SHEET_CACHE_TTL)
+        await run_sheets(warm_sheet_caches)
+
+# Cheap pre-gate for name extraction: only messages that even look like a
+# name statement reach the model, so ordinary chatter never pays that
+# round trip. The model still makes the final call on matches.
+_NAME_STATEMENT_RE = re.compile(
+    r"\b(mera naam|naam hai|my name is|i ?am|i'm|call me|"
+    r"mujhe .{1,30}\b(bulao|kaho|kehte)|main .{1,30}\bhoon)\b",
+    re.IGNORECASE
+)
+
 # --- NEW: AI-based name extraction (UPDATED LOGIC) ---
 async def get_name_from_ai(user_message: str):
     """Uses AI to extract a user's name from a message, but only if the user is explicitly stating their name."""
     prompt = f"Given the user message: '{user_message}', does the user explicitly state their name? For example, phrases like 'mera naam Ravi hai' or 'I am Sarah'. If yes, extract ONLY the name. If no, respond with 'NoName'."
     try:
-        response = model.generate_content(
+        response = await run_gemini(
+            model.generate_content_async,
             prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.1,
-                max_output_tokens=15
-            )
+            generation_config=_NAME_EXTRACT_CONFIG
         )
         ai_text = response.text.strip().replace('*', '')
         if ai_text.lower() == 'noname':
@@ -298,50 +796,59 @@ async def get_name_from_ai(user_message: str):
         logger.error(f"Error detecting name with AI: {e}")
         return None
 
+# --- Date/time query handling (built once; the check runs per message) ---
+KOLKATA_TZ = pytz.timezone('Asia/Kolkata')
+DATE_TIME_RE = re.compile(
+    r'time kya hai|what is the time|samay kya hai|kitne baje hain|'
+    r'aaj ki date kya hai|aaj kya tarikh hai|what is the date'
+)
+NAME_QUERY_RE = re.compile(
+    r'mera naam kya hai|what is my name|whats my name|'
+    r'tumhe mera naam pata hai|do you know my name|kya bulaogi mujhe'
+)
+_TIME_WORDS = frozenset({'time', 'samay', 'baje'})
+_DATE_WORDS = frozenset({'date', 'tarikh'})
+_WORD_RE = re.compile(r'\w+')
+
 # --- AI Response Function with Fallback to Google Sheets and Gemma ---
-async def get_bot_response(user_message: str, chat_id: int, bot_username: str, should_use_ai: bool, update: Update) -> str:
-    global current_api_key_index, active_api_key, model
+async def get_bot_response(user_message: str, chat_id: int, should_use_ai: bool, update: Update) -> str:
+    global active_api_key
+
+    # Bail out before doing any work (including the Google Sheets lookup below)
+    # for group messages that are not directed at the bot.
+    is_private = update.effective_chat and update.effective_chat.type == 'private'
+    if not (should_use_ai or is_private):
+        return None
+
     user_message_lower = user_message.lower()
-    
+
     # --- NEW: Handle Date/Time Queries ---
-    kolkata_tz = pytz.timezone('Asia/Kolkata')
-    date_time_patterns = [
-        r'time kya hai', r'what is the time', r'samay kya hai', r'kitne baje hain',
-        r'aaj ki date kya hai', r'aaj kya tarikh hai', r'what is the date'
-    ]
-    if any(re.search(pattern, user_message_lower) for pattern in date_time_patterns):
-        current_kolkata_time = datetime.now(kolkata_tz)
+    if DATE_TIME_RE.search(user_message_lower):
+        current_kolkata_time = datetime.now(KOLKATA_TZ)
         current_time = current_kolkata_time.strftime("%I:%M %p").lstrip('0')
         current_date = current_kolkata_time.strftime("%B %d, %Y")
-        
-        if 'time' in user_message_lower or 'samay' in user_message_lower or 'baje' in user_message_lower:
+
+        tokens = frozenset(_WORD_RE.findall(user_message_lower))
+        if tokens & _TIME_WORDS:
             return f"Abhi {current_time} ho rahe hain."
-        elif 'date' in user_message_lower or 'tarikh' in user_message_lower:
+        elif tokens & _DATE_WORDS:
             return f"Aaj {current_date} hai."
         else:
             return f"Abhi {current_time} ho rahe hain aur aaj {current_date} hai."
 
     # Handle "what's my name" query first
-    name_query_patterns = [
-        r'mera naam kya hai\s*(\?)*',
-        r'what is my name\s*(\?)*',
-        r'whats my name\s*(\?)*',
-        r'tumhe mera naam pata hai\s*(\?)*',
-        r'do you know my name\s*(\?)*',
-        r'kya bulaogi mujhe\s*(\?)*'
-    ]
-    is_name_query = any(re.search(pattern, user_message_lower, re.IGNORECASE) for pattern in name_query_patterns)
+    is_name_query = NAME_QUERY_RE.search(user_message_lower) is not None
 
     if is_name_query:
-        user_name = find_user_name(update.effective_user.id)
+        user_name = await run_sheets(find_user_name, update.effective_user.id)
         if user_name:
             return f"Aapka naam **{user_name}** hai, jaisa ki aapne mujhe bataya tha."
         else:
             awaiting_name[chat_id] = True
             return "Mujhe abhi tak aapka naam nahi pata."
     
-    cleaned_user_message = clean_message_for_logging(user_message, bot_username)
-    sheet_response = find_answer_in_sheet(cleaned_user_message)
+    cleaned_user_message = clean_message_for_logging(user_message_lower)
+    sheet_response = await run_sheets(find_answer_in_sheet, cleaned_user_message)
     if sheet_response:
         logger.info(f"[{chat_id}] Serving response from Google Sheet.")
         return sheet_response
@@ -349,30 +856,35 @@ async def get_bot_response(user_message: str, chat_id: int, bot_username: str, s
     if static_response:
         logger.info(f"[{chat_id}] Serving response from static dictionary.")
         return static_response
-    if should_use_ai or (update.effective_chat and update.effective_chat.type == 'private'):
-        max_retries = len(GEMINI_API_KEYS)
+    if should_use_ai or is_private:
+        # Only configured keys count; with none, fall straight through to Gemma.
+        max_retries = len(_available_keys)
         retries = 0
         while retries < max_retries:
-            if time.time() < key_cooldown_until[active_api_key]:
-                current_api_key_index = (current_api_key_index + 1) % len(GEMINI_API_KEYS)
-                active_api_key = GEMINI_API_KEYS[current_api_key_index]
-                retries += 1
-                genai.configure(api_key=active_api_key)
-                model = genai.GenerativeModel(model_name, system_instruction=LAILA_SYSTEM_PROMPT)
-                continue
+            active_api_key, available_at = await pick_best_key()
+            if time.time() < available_at:
+                # Even the earliest-available key is still cooling down.
+                logger.critical(f"[{chat_id}] All API keys are cooling down. Attempting to use Gemma model.")
+                break
             try:
-                genai.configure(api_key=active_api_key)
-                model = genai.GenerativeModel(model_name, system_instruction=LAILA_SYSTEM_PROMPT)
-                chat_session = model.start_chat(history=chat_histories[chat_id])
+                active_model = get_chat_model(active_api_key)
                 is_detailed_query = len(user_message.split()) > 5 or '?' in user_message or 'how to' in user_message_lower
-                response = chat_session.send_message(
-                    user_message,
-                    generation_config=genai.types.GenerationConfig(
-                        max_output_tokens=350 if is_detailed_query else 100,
-                        temperature=0.9,
+
+                async def generate_reply(active_model=active_model):
+                    # The SDK expects role/parts dicts; build them at the boundary.
+                    chat_session = active_model.start_chat(history=build_prompt_history(chat_id))
+                    # Stream the response so generation overlaps with network
+                    # transfer instead of waiting for the full completion.
+                    response_stream = await chat_session.send_message_async(
+                        user_message,
+                        stream=True,
+                        generation_config=_DETAILED_REPLY_CONFIG if is_detailed_query else _SHORT_REPLY_CONFIG
                     )
-                )
-                ai_text_response = response.text
+                    return "".join([chunk.text async for chunk in response_stream])
+
+                ai_text_response = await run_gemini(generate_reply)
+                # Enqueued for the batched background flush; the user-facing
+                # reply isn't held up by a Sheets round-trip.
                 save_qa_to_sheet(cleaned_user_message, ai_text_response)
                 return ai_text_response
             except genai.types.BlockedPromptException as e:
@@ -382,9 +894,8 @@ async def get_bot_response(user_message: str, chat_id: int, bot_username: str, s
                 error_str = str(e)
                 if "429 Quota exceeded" in error_str or "You exceeded your current quota" in error_str or "500" in error_str:
                     logger.warning(f"[{chat_id}] API key {active_api_key[-5:]} failed with error: {e}. Shifting to next key.")
+                    # The heap picks up the new cooldown lazily on the next pick.
                     key_cooldown_until[active_api_key] = time.time() + (1 * 60 * 60)
-                    current_api_key_index = (current_api_key_index + 1) % len(GEMINI_API_KEYS)
-                    active_api_key = GEMINI_API_KEYS[current_api_key_index]
                     retries += 1
                     if retries == max_retries:
                         logger.critical(f"[{chat_id}] All API keys exhausted. Attempting to use Gemma model.")
@@ -395,9 +906,11 @@ async def get_bot_response(user_message: str, chat_id: int, bot_username: str, s
                     return f"Oops! I couldn't understand that. The error was: {e}"
         if GEMMA_API_KEY:
             try:
-                genai.configure(api_key=GEMMA_API_KEY)
-                gemma_model = genai.GenerativeModel('gemma-7b-it', system_instruction=LAILA_SYSTEM_PROMPT)
-                gemma_response = gemma_model.generate_content(user_message)
+                _ensure_configured(GEMMA_API_KEY)
+                gemma_model = _model_cache.get(GEMMA_API_KEY)
+                if gemma_model is None:
+                    gemma_model = _model_cache[GEMMA_API_KEY] = genai.GenerativeModel('gemma-7b-it', system_instruction=LAILA_SYSTEM_PROMPT)
+                gemma_response = await run_gemini(gemma_model.generate_content_async, user_message)
                 ai_text_response = gemma_response.text
                 save_qa_to_sheet(cleaned_user_message, ai_text_response)
                 logger.info(f"[{chat_id}] All Gemini keys failed. Successfully used dedicated Gemma key.")
@@ -410,43 +923,119 @@ async def get_bot_response(user_message: str, chat_id: int, bot_username: str, s
             return "Apologies, I'm currently offline. Please try again later."
     return None
 
-# --- AI check to see if a message is directed at the bot ---
+# --- Local check to see if a message is directed at the bot ---
+# Deterministic pre-filters: obvious chatter never reaches the scorer.
+# Only the ambiguous middle — messages that look like a question but don't
+# address anyone, or address the bot without asking anything — falls
+# through to a weighted keyword score. The whole check runs in-process;
+# classification never costs a network round trip.
+_TRIVIAL_RE = re.compile(r"^(ok|okay|hi|hello|hey|thanks?|ty|thik hai|lol|haan|nahi|hmm+|👍|❤️)[!. ]*$", re.IGNORECASE)
+_QUESTION_RE = re.compile(r"[?]|\b(kya|kaise|kyun|why|how|what|when|who|where|can you|could you|tell me|batao)\b", re.IGNORECASE)
+_ADDRESSED_RE = re.compile(r"\b(laila|bot|tum|tu|aap|you|tumse|tujhe|tumhe|aapko)\b", re.IGNORECASE)
+# Rebuilt in post_init with the real username folded in, so bare "@LailaBot"
+# or "lailabot" forms count as addressed without a model call.
+_laila_trigger_re = _ADDRESSED_RE
+
+# Keyword weights for the ambiguous middle. Positive terms ask for or
+# direct something at the second person; negative terms mark third-person
+# group chatter. Tuned by eyeballing real group traffic, not trained.
+_INTENT_WEIGHTS = {
+    'laila': 3.0, 'bot': 2.0,
+    'tumse': 1.5, 'tujhe': 1.5, 'tumhe': 1.5, 'aapko': 1.5,
+    'tum': 1.0, 'tu': 1.0, 'aap': 1.0, 'you': 1.0,
+    'batao': 1.5, 'bata': 1.0, 'bolo': 1.0, 'suno': 1.0,
+    'tell': 1.0, 'help': 1.0, 'please': 0.5, 'plz': 0.5,
+    'usne': -1.5, 'uska': -1.5, 'uski': -1.5, 'unhone': -1.5,
+    'woh': -1.0, 'guys': -1.0, 'bhai': -0.5, 'yaar': -0.5, 'sab': -0.5,
+}
+_INTENT_THRESHOLD = 1.0
+
+def _score_intent(cache_key: str) -> bool:
+    score = sum(_INTENT_WEIGHTS.get(token, 0.0) for token in cache_key.split())
+    if '?' in cache_key:
+        score += 0.5
+    return score >= _INTENT_THRESHOLD
+
+_intent_fast_path = 0
+_intent_scored = 0
+
 async def is_message_for_laila(user_message: str) -> bool:
-    prompt = f"Given the user message: '{user_message}', is it a question or command directed at an AI assistant? Answer only 'Yes' or 'No'."
-    try:
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.1,
-                max_output_tokens=10
-            )
-        )
-        return "yes" in response.text.lower()
-    except Exception as e:
-        logger.error(f"Error checking if message is for Laila: {e}")
+    global _intent_fast_path, _intent_scored
+    cache_key = _WS_RE.sub(' ', user_message.lower().strip())
+    # Clear cases resolve on the regexes alone: addressed questions are for
+    # the bot, unaddressed non-questions are room chatter.
+    is_addressed = _laila_trigger_re.search(cache_key) is not None
+    is_question = _QUESTION_RE.search(cache_key) is not None
+    if is_addressed and is_question:
+        _intent_fast_path += 1
+        return True
+    if not is_addressed and not is_question:
+        _intent_fast_path += 1
         return False
+    _intent_scored += 1
+    return _score_intent(cache_key)
+
+# Admin status rarely changes mid-conversation; cache it briefly so bursts
+# of moderation commands don't repeat the get_chat_member round-trip.
+_ADMIN_CACHE_TTL = 60.0
+_ADMIN_CACHE_MAX = 4096
+_admin_cache = {}
+_ADMIN_STATUSES = frozenset({'creator', 'administrator'})
 
 async def is_admin(bot: Bot, chat_id: int, user_id: int) -> bool:
+    cache_key = (chat_id, user_id)
+    cached = _admin_cache.get(cache_key)
+    now = time.monotonic()
+    if cached and now - cached[1] < _ADMIN_CACHE_TTL:
+        return cached[0]
     try:
         member = await bot.get_chat_member(chat_id, user_id)
-        return member.status in ['creator', 'administrator']
+        result = member.status in _ADMIN_STATUSES
+        if len(_admin_cache) >= _ADMIN_CACHE_MAX:
+            # Sweep expired entries so the cache can't grow with every
+            # (chat, user) pair ever checked.
+            cutoff = now - _ADMIN_CACHE_TTL
+            for stale_key in [k for k, v in _admin_cache.items() if v[1] < cutoff]:
+                del _admin_cache[stale_key]
+        _admin_cache[cache_key] = (result, now)
+        return result
     except Exception as e:
         logger.error(f"Error checking admin status: {e}")
         return False
 
+# Group member counts move slowly; cache them for a few hours so every
+# broadcast doesn't re-query every group.
+_MEMBER_COUNT_TTL = 21600.0
+_member_count_cache = {}
+
+async def get_member_count(bot: Bot, chat_id: int) -> int:
+    cached = _member_count_cache.get(chat_id)
+    now = time.monotonic()
+    if cached and now - cached[1] < _MEMBER_COUNT_TTL:
+        return cached[0]
+    count = await bot.get_chat_member_count(chat_id)
+    _member_count_cache[chat_id] = (count, now)
+    db_record_member_count(chat_id, count)
+    return count
+
 # --- Error-Handled Admin Commands ---
 async def ban_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
-    if not await is_admin(context.bot, chat_id, user_id):
-        await context.bot.send_message(chat_id=chat_id, text="Sorry, you need to be an admin to use this command.")
-        return
     try:
         target_user = update.message.reply_to_message.from_user
     except AttributeError:
         await context.bot.send_message(chat_id=chat_id, text="Please reply to a user's message to ban them.")
         return
-    if await is_admin(context.bot, chat_id, target_user.id):
+    # Run both membership checks concurrently instead of as serial RPCs.
+    invoker_is_admin, target_is_admin = await asyncio.gather(
+        is_admin(context.bot, chat_id, user_id),
+        is_admin(context.bot, chat_id, target_user.id)
+    )
+    if not invoker_is_admin:
+        await context.bot.send_message(chat_id=chat_id, text="Sorry, you need to be an admin to use this command.")
+        return
+    if target_is_admin:
         await context.bot.send_message(chat_id=chat_id, text="I cannot ban another admin.")
         return
     try:
@@ -460,15 +1049,19 @@ async def ban_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def kick_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
-    if not await is_admin(context.bot, chat_id, user_id):
-        await context.bot.send_message(chat_id=chat_id, text="Sorry, you need to be an admin to use this command.")
-        return
     try:
         target_user = update.message.reply_to_message.from_user
     except AttributeError:
         await context.bot.send_message(chat_id=chat_id, text="Please reply to a user's message to kick them.")
         return
-    if await is_admin(context.bot, chat_id, target_user.id):
+    invoker_is_admin, target_is_admin = await asyncio.gather(
+        is_admin(context.bot, chat_id, user_id),
+        is_admin(context.bot, chat_id, target_user.id)
+    )
+    if not invoker_is_admin:
+        await context.bot.send_message(chat_id=chat_id, text="Sorry, you need to be an admin to use this command.")
+        return
+    if target_is_admin:
         await context.bot.send_message(chat_id=chat_id, text="I cannot kick another admin.")
         return
     try:
@@ -482,15 +1075,19 @@ async def kick_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def mute_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
-    if not await is_admin(context.bot, chat_id, user_id):
-        await context.bot.send_message(chat_id=chat_id, text="Sorry, you need to be an admin to use this command.")
-        return
     try:
         target_user = update.message.reply_to_message.from_user
     except AttributeError:
         await context.bot.send_message(chat_id=chat_id, text="Please reply to a user's message to mute them.")
         return
-    if await is_admin(context.bot, chat_id, target_user.id):
+    invoker_is_admin, target_is_admin = await asyncio.gather(
+        is_admin(context.bot, chat_id, user_id),
+        is_admin(context.bot, chat_id, target_user.id)
+    )
+    if not invoker_is_admin:
+        await context.bot.send_message(chat_id=chat_id, text="Sorry, you need to be an admin to use this command.")
+        return
+    if target_is_admin:
         await context.bot.send_message(chat_id=chat_id, text="I cannot mute another admin.")
         return
     try:
@@ -531,6 +1128,7 @@ async def poweron_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await context.bot.send_message(chat_id=update.effective_chat.id, text="The bot is already globally powered on.")
         return
     global_bot_status = True
+    db_set_setting('global_bot_status', '1')
     await context.bot.send_message(chat_id=update.effective_chat.id, text="The bot has been globally powered ON.")
 
 async def poweroff_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -543,10 +1141,60 @@ async def poweroff_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         await context.bot.send_message(chat_id=update.effective_chat.id, text="The bot is already globally powered OFF.")
         return
     global_bot_status = False
+    db_set_setting('global_bot_status', '0')
     await context.bot.send_message(chat_id=update.effective_chat.id, text="The bot has been globally powered OFF.")
-    application.stop()
+    # application.stop() referenced a global that doesn't exist (NameError);
+    # stop_running() is PTB's supported way to leave run_polling from a handler.
+    context.application.stop_running()
 
 # --- Broadcast command for Owner only, preserving formatting ---
+# Bot API allows ~30 messages/second across all chats; a token-bucket limiter
+# lets sends run concurrently right up to that budget instead of serializing
+# them with a fixed sleep per chat.
+_BROADCAST_RATE = 30
+
+# The API also caps messages to any single group at ~20/minute. Per-chat
+# limiters live at module level so back-to-back broadcasts share the budget.
+_PER_CHAT_RATE = 20
+_per_chat_limiters = {}
+
+def _chat_limiter(chat_id):
+    limiter = _per_chat_limiters.get(chat_id)
+    if limiter is None:
+        limiter = _per_chat_limiters[chat_id] = AsyncLimiter(_PER_CHAT_RATE, 60)
+    return limiter
+
+async def _broadcast_to_all(send_one, recipients):
+    """Sends to every recipient concurrently, pacing starts with a rate limiter.
+
+    Returns a (success_count, failure_count) tuple. Flood-wait replies are
+    honored once per chat before counting the send as failed.
+    """
+    limiter = AsyncLimiter(_BROADCAST_RATE, 1)
+
+    async def paced_send(target_chat_id):
+        # Per-chat budget first so a chat waiting out its window doesn't
+        # hold a global token the other sends could use.
+        async with _chat_limiter(target_chat_id), limiter:
+            try:
+                await send_one(target_chat_id)
+                return True
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                try:
+                    await send_one(target_chat_id)
+                    return True
+                except Exception as retry_error:
+                    logger.error(f"Error broadcasting to chat {target_chat_id}: {retry_error}")
+                    return False
+            except Exception as e:
+                logger.error(f"Error broadcasting to chat {target_chat_id}: {e}")
+                return False
+
+    results = await asyncio.gather(*(paced_send(chat_id) for chat_id in recipients))
+    success_count = sum(results)
+    return success_count, len(results) - success_count
+
 async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
     if user_id != BROADCAST_ADMIN_ID:
@@ -557,23 +1205,15 @@ async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     message_to_send = " ".join(context.args)
     message_to_send = message_to_send.replace('\n', '<br>')
-    success_count = 0
-    failure_count = 0
-    global known_users
-    if not known_users:
-        load_known_users()
-    for chat_id in known_users:
-        try:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=message_to_send,
-                parse_mode='HTML'
-            )
-            success_count += 1
-            await asyncio.sleep(0.1)
-        except Exception as e:
-            logger.error(f"Error broadcasting to chat {chat_id}: {e}")
-            failure_count += 1
+
+    async def send_one(target_chat_id):
+        await context.bot.send_message(
+            chat_id=target_chat_id,
+            text=message_to_send,
+            parse_mode='HTML'
+        )
+
+    success_count, failure_count = await _broadcast_to_all(send_one, tuple(known_users))
     await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Broadcast complete! Sent to {success_count} chats. Failed for {failure_count} chats.")
     logger.info(f"Broadcast sent by admin. Success: {success_count}, Failure: {failure_count}")
 
@@ -601,24 +1241,16 @@ async def broadcast_photo_command(update: Update, context: ContextTypes.DEFAULT_
     photo_file_id = context.args[0]
     message_to_send = " ".join(context.args[1:])
     message_to_send = message_to_send.replace('\n', '<br>')
-    success_count = 0
-    failure_count = 0
-    global known_users
-    if not known_users:
-        load_known_users()
-    for chat_id in known_users:
-        try:
-            await context.bot.send_photo(
-                chat_id=chat_id,
-                photo=photo_file_id,
-                caption=message_to_send,
-                parse_mode='HTML'
-            )
-            success_count += 1
-            await asyncio.sleep(0.1)
-        except Exception as e:
-            logger.error(f"Error broadcasting photo to chat {chat_id}: {e}")
-            failure_count += 1
+
+    async def send_one(target_chat_id):
+        await context.bot.send_photo(
+            chat_id=target_chat_id,
+            photo=photo_file_id,
+            caption=message_to_send,
+            parse_mode='HTML'
+        )
+
+    success_count, failure_count = await _broadcast_to_all(send_one, tuple(known_users))
     await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Photo broadcast complete! Sent to {success_count} chats. Failed for {failure_count} chats.")
     logger.info(f"Photo broadcast sent by admin. Success: {success_count}, Failure: {failure_count}")
 
@@ -631,40 +1263,48 @@ async def forward_all_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     if not update.message.reply_to_message:
         await context.bot.send_message(chat_id=update.effective_chat.id, text="Please reply to a message to forward it to all chats.")
         return
-    success_count = 0
-    failure_count = 0
-    global known_users
-    if not known_users:
-        load_known_users()
-    for chat_id in known_users:
-        try:
-            await context.bot.forward_message(
-                chat_id=chat_id,
-                from_chat_id=update.message.chat_id,
-                message_id=update.message.reply_to_message.message_id
-            )
-            success_count += 1
-            await asyncio.sleep(0.1)
-        except Exception as e:
-            logger.error(f"Error forwarding message to chat {chat_id}: {e}")
-            failure_count += 1
+
+    async def send_one(target_chat_id):
+        await context.bot.forward_message(
+            chat_id=target_chat_id,
+            from_chat_id=update.message.chat_id,
+            message_id=update.message.reply_to_message.message_id
+        )
+
+    success_count, failure_count = await _broadcast_to_all(send_one, tuple(known_users))
     await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Message forwarded! Sent to {success_count} chats. Failed for {failure_count} chats.")
     logger.info(f"Message forwarded by admin. Success: {success_count}, Failure: {failure_count}")
 
+# Static message bodies live at module level; handlers interpolate only the
+# dynamic fields instead of rebuilding the whole text each call.
+_WELCOME_TMPL = (
+    "Hey there! 😉\n\n"
+    "I'm Laila, your friendly AI assistant. 🤖\n"
+    "I'm here to chat, answer your questions, and help you with anything you need. 😘\n\n"
+    "You can use `/help` to see all the commands.\n"
+    "Let's get started, `{user_name}`! 💖"
+)
+
+_STATS_TMPL = (
+    "❤️ **Laila's Live Stats** ❤️\n\n"
+    "⚡️ **Ping**: `{ping_ms}ms`\n"
+    "⏳ **Uptime**: `{uptime}`\n"
+    "🧠 **RAM**: `{ram}%`\n"
+    "💻 **CPU**: `{cpu}%`\n"
+    "💾 **Disk**: `{disk}%`\n\n"
+    "✨ by AdhyanXlive ✨"
+)
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_name = update.effective_user.first_name
     chat_id = update.effective_chat.id
-    
-    if str(chat_id) not in known_users:
-        known_users.add(str(chat_id))
-        save_chat_id(chat_id)
-    welcome_message = (
-        f"Hey there! 😉\n\n"
-        f"I'm Laila, your friendly AI assistant. 🤖\n"
-        f"I'm here to chat, answer your questions, and help you with anything you need. 😘\n\n"
-        f"You can use `/help` to see all the commands.\n"
-        f"Let's get started, `{user_name}`! 💖"
-    )
+
+    if chat_id not in known_users:
+        known_users.add(chat_id)
+        chat_types[chat_id] = update.effective_chat.type
+        # Fire-and-forget: /start should not wait on a Sheets round-trip.
+        asyncio.create_task(run_sheets(save_chat_id, chat_id, update.effective_chat.type))
+    welcome_message = _WELCOME_TMPL.format(user_name=user_name)
     # UPDATED with your provided photo ID
     photo_file_id = 'AgACAgUAAxkBAAIIKGigVdAK07aRr9QiXpRalahcPO2pAAIL0DEblXUBVSY5LS31XxPSAQADAgADeAADNgQ'
     try:
@@ -681,25 +1321,13 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
-    global start_time
-    ping_start = time.time()
-    await context.bot.send_chat_action(chat_id=chat_id, action="typing")
-    ping_end = time.time()
-    uptime = datetime.now() - start_time
-    hours, remainder = divmod(uptime.seconds, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    uptime_str = f"{uptime.days}d {hours}h {minutes}m {seconds}s"
-    ram_usage = psutil.virtual_memory().percent
-    cpu_usage = psutil.cpu_percent(interval=1)
-    disk_usage = psutil.disk_usage('/').percent
-    response_text = (
-        "❤️ **Laila's Live Stats** ❤️\n\n"
-        f"⚡️ **Ping**: `{int((ping_end - ping_start) * 1000)}ms`\n"
-        f"⏳ **Uptime**: `{uptime_str}`\n"
-        f"🧠 **RAM**: `{ram_usage}%`\n"
-        f"💻 **CPU**: `{cpu_usage}%`\n"
-        f"💾 **Disk**: `{disk_usage}%`\n\n"
-        "✨ by AdhyanXlive ✨"
+    # Inbound latency from the message's own Telegram timestamp: no extra
+    # API call just to time one, and it measures the path users actually feel.
+    ping_ms = max(0, int((datetime.now(timezone.utc) - update.message.date).total_seconds() * 1000))
+    uptime_str = format_uptime()
+    ram_usage, cpu_usage, disk_usage = get_system_usage()
+    response_text = _STATS_TMPL.format(
+        ping_ms=ping_ms, uptime=uptime_str, ram=ram_usage, cpu=cpu_usage, disk=disk_usage
     )
     # UPDATED with your provided photo ID
     photo_file_id = 'AgACAgUAAxkBAAIIKGigVdAK07aRr9QiXpRalahcPO2pAAIL0DEblXUBVSY5LS31XxPSAQADAgADeAADNgQ'
@@ -721,16 +1349,9 @@ async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     if user_id != BROADCAST_ADMIN_ID:
         await context.bot.send_message(chat_id=chat_id, text="Sorry, you don't have permission to use this command.")
         return
-    ping_start = time.time()
-    await context.bot.send_chat_action(chat_id=chat_id, action="typing")
-    ping_end = time.time()
-    uptime = datetime.now() - start_time
-    hours, remainder = divmod(uptime.seconds, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    uptime_str = f"{uptime.days}d {hours}h {minutes}m {seconds}s"
-    ram_usage = psutil.virtual_memory().percent
-    cpu_usage = psutil.cpu_percent(interval=1)
-    disk_usage = psutil.disk_usage('/').percent
+    ping_ms = max(0, int((datetime.now(timezone.utc) - update.message.date).total_seconds() * 1000))
+    uptime_str = format_uptime()
+    ram_usage, cpu_usage, disk_usage = get_system_usage()
     # --- Service Status Checks ---
     bot_connection_status = "✅ Connected"
     try:
@@ -739,7 +1360,8 @@ async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         bot_connection_status = "❌ Failed"
     sheets_connection_status = "✅ Connected"
     try:
-        sheet, _ = get_google_sheet_connection()
+        # The connection probe is blocking gspread I/O; keep it off the loop.
+        sheet, _ = await run_sheets(get_google_sheet_connection)
         if not sheet or not sheet.title:
             raise Exception("Could not get sheet title")
     except Exception as e:
@@ -754,8 +1376,8 @@ async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         if key:
             key_short = key[-5:]
             status = "Active" if key == active_api_key else "Inactive"
-            if time.time() < key_cooldown_until[key]:
-                cooldown_remaining = int(key_cooldown_until[key] - time.time())
+            if time.time() < key_cooldown_until.get(key, 0):
+                cooldown_remaining = int(key_cooldown_until.get(key, 0) - time.time())
                 status = f"Cooldown ({cooldown_remaining}s)"
             api_key_status_text += f"Key {i+1} (`...{key_short}`): {status}\n"
         else:
@@ -767,7 +1389,7 @@ async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     response_text = (
         "👑 **Laila's Admin Report** 👑\n\n"
         "**System Health**\n"
-        f" Ping: `{int((ping_end - ping_start) * 1000)}ms`\n"
+        f" Ping: `{ping_ms}ms`\n"
         f" Uptime: `{uptime_str}`\n"
         f" RAM: `{ram_usage}%`\n"
         f" CPU: `{cpu_usage}%`\n"
@@ -779,7 +1401,8 @@ async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         f" Render Status: `{render_status}`\n\n"
         "**Bot Stats**\n"
         f" Total Chats: `{len(known_users)}`\n"
-        f" Total Messages: `{total_messages_processed}`\n\n"
+        f" Total Messages: `{total_messages_processed}`\n"
+        f" Intent Checks: `{_intent_fast_path} fast / {_intent_scored} scored`\n\n"
         "**API Status**\n"
         f"{api_key_status_text}"
         "\n✨ by AdhyanXlive ✨"
@@ -794,33 +1417,34 @@ async def show_chats_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if user_id != BROADCAST_ADMIN_ID:
         await context.bot.send_message(chat_id=chat_id, text="Sorry, this command is for the bot owner only.")
         return
-    global known_users
-    if not known_users:
-        load_known_users()
     known_chats = list(known_users)
     if not known_chats:
         await context.bot.send_message(chat_id=chat_id, text="The bot is not in any groups or private chats yet.")
         return
-    chat_details = []
-    for chat_id_str in known_chats:
-        try:
-            chat = await context.bot.get_chat(chat_id_str)
-            if chat.type == 'private':
-                chat_details.append(f"• **User**: `{chat.full_name}` (ID: `{chat_id_str}`)")
-            else:
+    # Fetch chat details concurrently (bounded) instead of one serial
+    # get_chat + sleep(0.1) per chat, which took minutes for large lists.
+    semaphore = asyncio.Semaphore(20)
+
+    async def fetch_chat_details(chat_id_str):
+        async with semaphore:
+            try:
+                chat = await context.bot.get_chat(chat_id_str)
+                if chat.type == 'private':
+                    return f"• **User**: `{chat.full_name}` (ID: `{chat_id_str}`)"
                 members_count = "Count not available"
                 try:
-                    members_count = await context.bot.get_chat_member_count(chat_id_str)
+                    members_count = await get_member_count(context.bot, chat_id_str)
                 except Exception:
                     pass
-                chat_details.append(
+                return (
                     f"• **Group**: `{chat.title}` (ID: `{chat_id_str}`)\n"
                     f"  Members: `{members_count}`\n"
                     f"  Link: [t.me/{chat.username}](https://t.me/{chat.username})" if chat.username else f"  *No username found.*"
                 )
-        except Exception:
-            chat_details.append(f"• **Unknown Chat**: ID: `{chat_id_str}` (Bot may have been removed)")
-        await asyncio.sleep(0.1)
+            except Exception:
+                return f"• **Unknown Chat**: ID: `{chat_id_str}` (Bot may have been removed)"
+
+    chat_details = await asyncio.gather(*[fetch_chat_details(c) for c in known_chats])
 
     response_text = "✨ **Laila's Chats** ✨\n\n" + "\n\n".join(chat_details)
     
@@ -841,42 +1465,100 @@ async def paid_broadcast_command(update: Update, context: ContextTypes.DEFAULT_T
     original_message = update.message.reply_to_message
     broadcast_id = str(uuid.uuid4())[:8]
     broadcast_start_time = datetime.now()
+    # perf_counter for the duration: immune to wall-clock (NTP) jumps.
+    timer_start = time.perf_counter()
     successful_users = 0
     successful_groups = 0
     total_group_members = 0
     failed_chats = []
-    global known_users
-    if not known_users:
-        load_known_users()
     logger.info(f"Starting paid broadcast with ID {broadcast_id}...")
-    for chat_id_str in list(known_users):
-        try:
-            chat_id_int = int(chat_id_str)
-            chat = await context.bot.get_chat(chat_id_int)
-            await context.bot.copy_message(
-                chat_id=chat_id_int,
-                from_chat_id=update.effective_chat.id,
-                message_id=original_message.message_id
-            )
-            if chat.type == 'private':
-                successful_users += 1
-            else:
-                successful_groups += 1
+    # Fan out with bounded concurrency near Telegram's ~30 msg/s ceiling
+    # instead of one serial send per 0.1s, honoring flood-wait hints.
+    semaphore = asyncio.Semaphore(30)
+    limiter = AsyncLimiter(_BROADCAST_RATE, 1)
+
+    async def send_one(target_chat_id):
+        async with semaphore, limiter:
+            try:
+                # Chat type is recorded when the chat is first seen; only fall
+                # back to get_chat for chats saved before types were tracked.
+                chat_type = chat_types.get(target_chat_id)
+                if chat_type is None:
+                    chat_type = (await context.bot.get_chat(target_chat_id)).type
+                    chat_types[target_chat_id] = chat_type
+                try:
+                    await context.bot.copy_message(
+                        chat_id=target_chat_id,
+                        from_chat_id=chat_id,
+                        message_id=original_message.message_id
+                    )
+                except RetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                    await context.bot.copy_message(
+                        chat_id=target_chat_id,
+                        from_chat_id=chat_id,
+                        message_id=original_message.message_id
+                    )
+                if chat_type == 'private':
+                    return 'private', 0
+                member_count = 0
                 try:
-                    count = await context.bot.get_chat_member_count(chat_id_int)
-                    total_group_members += count
+                    member_count = await get_member_count(context.bot, target_chat_id)
                 except Exception:
                     pass
-        except Exception as e:
-            failed_chats.append(chat_id_str)
-            logger.error(f"Error broadcasting message to chat {chat_id_str}: {e}")
-    broadcast_end_time = datetime.now()
-    duration = broadcast_end_time - broadcast_start_time
+                return 'group', member_count
+            except Exception as e:
+                logger.error(f"Error broadcasting message to chat {target_chat_id}: {e}")
+                return 'failed', target_chat_id
+
+    # One immutable snapshot guards against mid-broadcast set mutation
+    # without paying for a second copy.
+    recipients = tuple(known_users)
+    # Progress lands in one pinned status message edited every ~50 sends;
+    # editing per send would itself eat into the message-rate budget.
+    progress_message = await context.bot.send_message(
+        chat_id=chat_id,
+        text=f"Broadcast `{broadcast_id}`: 0/{len(recipients)} chats done...",
+        parse_mode='Markdown'
+    )
+    completed = 0
+
+    async def tracked_send(target_chat_id):
+        nonlocal completed
+        result = await send_one(target_chat_id)
+        completed += 1
+        if completed % 50 == 0:
+            try:
+                await progress_message.edit_text(
+                    f"Broadcast `{broadcast_id}`: {completed}/{len(recipients)} chats done...",
+                    parse_mode='Markdown'
+                )
+            except Exception:
+                pass
+        return result
+
+    results = await asyncio.gather(*[tracked_send(c) for c in recipients])
+    try:
+        await progress_message.edit_text(
+            f"Broadcast `{broadcast_id}`: {len(recipients)}/{len(recipients)} chats done.",
+            parse_mode='Markdown'
+        )
+    except Exception:
+        pass
+    for outcome, value in results:
+        if outcome == 'private':
+            successful_users += 1
+        elif outcome == 'group':
+            successful_groups += 1
+            total_group_members += value
+        else:
+            failed_chats.append(value)
+    duration_s = time.perf_counter() - timer_start
     receipt_message = (
         f"**Paid Broadcast Receipt** ✨\n\n"
         f"**Broadcast ID**: `{broadcast_id}`\n"
         f"**Started At**: `{broadcast_start_time.strftime('%Y-%m-%d %H:%M:%S')}`\n"
-        f"**Duration**: `{duration.seconds}s`\n\n"
+        f"**Duration**: `{duration_s:.1f}s`\n\n"
         f"**Summary**\n"
         f"✅ Successful to `{successful_users}` private chats.\n"
         f"✅ Successful to `{successful_groups}` groups.\n"
@@ -884,38 +1566,74 @@ async def paid_broadcast_command(update: Update, context: ContextTypes.DEFAULT_T
         f"❌ Failed for `{len(failed_chats)}` chats.\n\n"
     )
     if failed_chats:
-        failed_chats_str = ", ".join(failed_chats)
-        receipt_message += f"**Failed Chat IDs**:\n`{failed_chats_str}`"
+        # Keep the receipt under Telegram's 4096-char message limit: preview
+        # the first 50 failures and attach the rest as a document.
+        failed_preview = ", ".join(str(c) for c in failed_chats[:50])
+        if len(failed_chats) > 50:
+            failed_preview += f" ... +{len(failed_chats) - 50} more"
+        receipt_message += f"**Failed Chat IDs**:\n`{failed_preview}`"
     await context.bot.send_message(chat_id=chat_id, text=receipt_message, parse_mode='Markdown')
+    if len(failed_chats) > 50:
+        failed_file = BytesIO("\n".join(str(c) for c in failed_chats).encode())
+        failed_file.name = f"failed_chats_{broadcast_id}.txt"
+        await context.bot.send_document(chat_id=chat_id, document=failed_file)
     logger.info(f"Paid broadcast {broadcast_id} finished. Receipt sent to admin.")
 
+async def _delayed_typing(bot, chat_id, delay=1.0):
+    """Shows 'typing...' only if the reply hasn't landed within the delay."""
+    try:
+        await asyncio.sleep(delay)
+        await bot.send_chat_action(chat_id=chat_id, action="typing")
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.debug(f"Could not send typing action to {chat_id}: {e}")
+
 # --- UPDATED process_message function with keyword-based name saving and DM fix ---
 async def process_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     global total_messages_processed
-    global_bot_enabled = global_bot_status
-    chat_enabled = bot_status[update.effective_chat.id]
-    is_private_chat = update.effective_chat.type == 'private'
-    if not global_bot_enabled or (not is_private_chat and not chat_enabled):
+    # Bind the PTB accessors once; they're properties re-evaluated per access.
+    chat = update.effective_chat
+    message = update.message
+    chat_id = chat.id
+    is_private_chat = chat.type == 'private'
+    if not global_bot_status or (not is_private_chat and not bot_status.get(chat_id, True)):
         return
-    bot_username = (await context.bot.get_me()).username
-    user_message = update.message.text or update.message.caption
-    chat_id = update.effective_chat.id
-    user_id = update.effective_user.id
-    if str(chat_id) not in known_users:
-        known_users.add(str(chat_id))
-        save_chat_id(chat_id)
+    user_message = message.text or message.caption
     if not user_message:
         return
-    is_reply_to_bot = update.message.reply_to_message and update.message.reply_to_message.from_user.id == context.bot.id
-    is_mention = f"@{bot_username.lower()}" in user_message.lower() or f"laila" in user_message.lower()
-
-    # --- NEW: AI-based name saving logic ---
-    found_name = await get_name_from_ai(user_message)
-    if found_name:
-        save_user_name(user_id, found_name)
-        await update.message.reply_text(f"Acha, to ab se main tumhe **{found_name}** bulaungi.", parse_mode='Markdown')
-        logger.info(f"[{chat_id}] Automatically saved name for user {user_id}: '{found_name}'.")
+    sender = update.effective_user
+    # Never react to our own (or any bot's echoed) messages. is_bot is a
+    # plain attribute of the decoded update, so the common human case pays
+    # one predictable branch and skips the ID compare entirely.
+    if sender.is_bot and sender.id == BOT_ID:
         return
+    user_id = sender.id
+    if chat_id not in known_users:
+        known_users.add(chat_id)
+        chat_types[chat_id] = chat.type
+        asyncio.create_task(run_sheets(save_chat_id, chat_id, chat.type))
+    reply_to = message.reply_to_message
+    is_reply_to_bot = reply_to and reply_to.from_user.id == BOT_ID
+    user_message_lower = user_message.lower()
+    is_mention = BOT_MENTION in user_message_lower or "laila" in user_message_lower
+
+    # Trivial chatter ("ok", "lol", bare emoji) can't be a name statement
+    # and, in groups, never needs classification either — drop it before
+    # any model call. Private chats still get their reply below.
+    is_trivial = _TRIVIAL_RE.match(user_message) is not None
+    if is_trivial and not (is_private_chat or is_reply_to_bot or is_mention):
+        logger.info(f"[{chat_id}] Trivial group message. Ignoring without classification.")
+        return
+
+    # --- NEW: AI-based name saving logic (regex pre-gated) ---
+    if not is_trivial and _NAME_STATEMENT_RE.search(user_message_lower):
+        found_name = await get_name_from_ai(user_message)
+        if found_name:
+            asyncio.create_task(run_sheets(save_user_name, user_id, found_name))
+            await message.reply_text(f"Acha, to ab se main tumhe **{found_name}** bulaungi.", parse_mode='Markdown')
+            logger.info(f"[{chat_id}] Automatically saved name for user {user_id}: '{found_name}'.")
+            return
 
     # --- UPDATED: AI-based intent check for group chats ---
     should_use_ai = is_private_chat or is_reply_to_bot or is_mention
@@ -926,18 +1644,26 @@ async def process_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             logger.info(f"[{chat_id}] Message was not directed at Laila. Ignoring.")
             return
     if should_use_ai:
+        # Deferred typing indicator: only fires if the response takes longer
+        # than a second, so fast replies (sheet/static hits) skip the extra
+        # API call entirely.
+        typing_task = asyncio.create_task(_delayed_typing(context.bot, chat_id))
         try:
-            await context.bot.send_chat_action(chat_id=chat_id, action="typing")
-            response_text = await get_bot_response(user_message, chat_id, bot_username, should_use_ai=True, update=update)
+            response_text = await get_bot_response(user_message, chat_id, should_use_ai=True, update=update)
+            typing_task.cancel()
             if response_text:
-                await update.message.reply_text(response_text)
+                # Start the send immediately; the history bookkeeping is
+                # independent of it and runs while the request is in flight.
+                send_task = asyncio.create_task(message.reply_text(response_text))
                 add_to_history(chat_id, 'user', user_message)
                 add_to_history(chat_id, 'model', response_text)
                 total_messages_processed += 1
+                await send_task
                 logger.info(f"[{chat_id}] Sent response to {user_id}: {response_text}")
         except Exception as e:
+            typing_task.cancel()
             logger.error(f"Error processing message for chat {chat_id}: {e}", exc_info=True)
-            await update.message.reply_text("An unexpected error occurred. Please try again later.")
+            await message.reply_text("An unexpected error occurred. Please try again later.")
     else:
         logger.info(f"[{chat_id}] Ignoring group message from {user_id}: {user_message}")
 
@@ -998,29 +1724,59 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             logger.error(f"Failed to send error notification to admin: {e}")
 
 def main() -> None:
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-    # Load known users from Google Sheets on startup
+    # A large pool for outbound API calls so concurrent broadcasts don't
+    # starve on connections, and a small dedicated pool for getUpdates
+    # long-polling so it never competes with sends.
+    # 256 outbound connections covers a full-rate broadcast (30 msg/s with
+    # slow receivers) with headroom; the shorter pool_timeout surfaces
+    # saturation as an error instead of silently queueing sends for 30s.
+    api_request = HTTPXRequest(connection_pool_size=256, pool_timeout=20, connect_timeout=10, read_timeout=20)
+    get_updates_request = HTTPXRequest(connection_pool_size=16, pool_timeout=20)
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .request(api_request)
+        .get_updates_request(get_updates_request)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    # Warm chat state from the local store, then merge in Google Sheets
+    db_load_chats()
     load_known_users()
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("about", about_command))
-    application.add_handler(CommandHandler("on", on_command))
-    application.add_handler(CommandHandler("off", off_command))
-    application.add_handler(CommandHandler("stats", stats_command))
-    # Owner-Only Commands
-    application.add_handler(CommandHandler("poweron", poweron_command))
-    application.add_handler(CommandHandler("poweroff", poweroff_command))
-    application.add_handler(CommandHandler("broadcast", broadcast_command))
-    application.add_handler(CommandHandler("broadcast_photo", broadcast_photo_command))
-    application.add_handler(CommandHandler("forward_all", forward_all_command))
-    application.add_handler(CommandHandler("get_photo_id", get_photo_id))
-    application.add_handler(CommandHandler("adminstats", admin_stats_command))
-    application.add_handler(CommandHandler("show_chats", show_chats_command))
-    application.add_handler(CommandHandler("paid_broadcast", paid_broadcast_command))
-    # Admin Commands
-    application.add_handler(CommandHandler("ban", ban_user))
-    application.add_handler(CommandHandler("kick", kick_user))
-    application.add_handler(CommandHandler("mute", mute_user))
+    # Table-driven registration. Group 0 carries the public and group-admin
+    # commands; the rarely used owner-only commands sit in group 1 so PTB's
+    # linear per-update handler scan stays short for ordinary traffic.
+    public_commands = (
+        ("start", start_command),
+        ("help", help_command),
+        ("about", about_command),
+        ("on", on_command),
+        ("off", off_command),
+        ("stats", stats_command),
+        ("ban", ban_user),
+        ("kick", kick_user),
+        ("mute", mute_user),
+    )
+    owner_commands = (
+        ("poweron", poweron_command),
+        ("poweroff", poweroff_command),
+        ("broadcast", broadcast_command),
+        ("broadcast_photo", broadcast_photo_command),
+        ("forward_all", forward_all_command),
+        ("get_photo_id", get_photo_id),
+        ("adminstats", admin_stats_command),
+        ("show_chats", show_chats_command),
+        ("paid_broadcast", paid_broadcast_command),
+    )
+    for name, callback in public_commands:
+        application.add_handler(CommandHandler(name, callback))
+    # The user filter runs before the coroutine is even created, so non-owner
+    # invocations are dropped during dispatch instead of inside the handler.
+    # The in-handler checks stay as a second line of defense.
+    owner_filter = filters.User(user_id=BROADCAST_ADMIN_ID)
+    for name, callback in owner_commands:
+        application.add_handler(CommandHandler(name, callback, filters=owner_filter), group=1)
     # Handle all text messages, including name-saving logic
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_message))
     application.add_handler(MessageHandler(filters.PHOTO & filters.REPLY, process_message))
@@ -1039,6 +1795,8 @@ def main() -> None:
     # To run in polling mode
     else:
         logger.info("Starting bot in polling mode.")
-        application.run_polling()
+        # Long-poll with timeout=30 so getUpdates only returns when there is
+        # data (or after 30s) instead of hammering Telegram with short polls.
+        application.run_polling(poll_interval=0.0, timeout=30, allowed_updates=Update.ALL_TYPES)
 if __name__ == '__main__':
     main()